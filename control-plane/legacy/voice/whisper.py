@@ -1,14 +1,276 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
-from faster_whisper import WhisperModel
-import tempfile
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from faster_whisper import WhisperModel, decode_audio
+from faster_whisper.audio import pad_or_trim
+from faster_whisper.tokenizer import Tokenizer
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import hashlib
+import io
+import json
+import logging
 import os
+import threading
+import time
+import numpy as np
 
-app = FastAPI()
+# orjson encodes straight to bytes when installed (`pip install orjson`); nothing
+# pins it for this service, so fall back to the stdlib encoder without it.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+_JSONResponse = ORJSONResponse if orjson is not None else JSONResponse
+app = FastAPI(default_response_class=_JSONResponse)
+
+logger = logging.getLogger("whisper")
+
+# Greedy decoding + VAD by default; set WHISPER_BEAM_SIZE=5 for offline/high-accuracy mode.
+WHISPER_BEAM_SIZE = int(os.getenv("WHISPER_BEAM_SIZE", "1"))
+WHISPER_LANGUAGE = os.getenv("WHISPER_LANGUAGE", "en") or None  # empty -> auto-detect
+WHISPER_VAD_FILTER = os.getenv("WHISPER_VAD_FILTER", "true").lower() in {"1", "true", "yes"}
 
 # Load Whisper model once at startup.
-# You can change "small" to "base", "medium", etc. if you want.
-model = WhisperModel("small", device="cpu", compute_type="int8")
+# WHISPER_MODEL can be "base", "medium", "large-v3-turbo", etc. (turbo keeps the
+# full large-v3 encoder, so it only pays off on GPU). "auto" device/compute type lets
+# CTranslate2 pick CUDA when present and the fastest supported type (int8 on CPU).
+# One CTranslate2 worker per allowed concurrent transcription, with the vCPUs split
+# between them so parallel decodes don't oversubscribe the int8 kernels.
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "small")
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "auto")
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "auto")
+WHISPER_MAX_CONCURRENT = int(os.getenv("WHISPER_MAX_CONCURRENT", "2"))
+WHISPER_NUM_WORKERS = int(os.getenv("WHISPER_NUM_WORKERS", str(WHISPER_MAX_CONCURRENT)))
+WHISPER_CPU_THREADS = int(
+    os.getenv("WHISPER_CPU_THREADS", str(max(1, (os.cpu_count() or 1) // max(1, WHISPER_NUM_WORKERS))))
+)
+
+model = WhisperModel(
+    WHISPER_MODEL,
+    device=WHISPER_DEVICE,
+    compute_type=WHISPER_COMPUTE_TYPE,
+    cpu_threads=WHISPER_CPU_THREADS,
+    num_workers=WHISPER_NUM_WORKERS,
+)
+
+# CTranslate2 releases the GIL, so unbounded concurrent requests fight over the
+# same cpu_threads; cap in-flight transcriptions instead.
+transcribe_semaphore = asyncio.Semaphore(WHISPER_MAX_CONCURRENT)
+# Dedicated pool so long decodes never starve Starlette's shared threadpool.
+transcribe_pool = ThreadPoolExecutor(
+    max_workers=WHISPER_MAX_CONCURRENT, thread_name_prefix="whisper"
+)
+
+
+# Retries/reconnects often re-send the exact same clip: remember recent transcripts
+# by content hash and let concurrent duplicates share one decode.
+WHISPER_CACHE_MAX = int(os.getenv("WHISPER_CACHE_MAX", "1024"))
+_transcript_cache: "OrderedDict[bytes, str]" = OrderedDict()
+_inflight: dict[bytes, asyncio.Task] = {}
+
+# Opt-in micro-batching: concurrent clips that arrive within the window and fit in
+# one 30 s Whisper window share a single batched encoder pass + generate call.
+# The batched path skips Silero VAD and temperature fallback, and needs a fixed
+# WHISPER_LANGUAGE; longer clips still go through model.transcribe.
+WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "1"))
+WHISPER_BATCH_WINDOW_MS = float(os.getenv("WHISPER_BATCH_WINDOW_MS", "20"))
+BATCHING_ENABLED = WHISPER_BATCH_SIZE > 1 and WHISPER_LANGUAGE is not None
+_batch_queue: asyncio.Queue | None = None
+
+
+def _decode(body: bytes) -> np.ndarray:
+    # Decode in-process to 16 kHz mono float32 (PyAV detects the container),
+    # so there is no temp file on disk and no ffmpeg re-open per request
+    return decode_audio(io.BytesIO(body), sampling_rate=16000)
+
+
+def _segments(body: bytes):
+    return _segments_for(_decode(body))
+
+
+def _segments_for(audio: np.ndarray):
+    # segments is a lazy generator: each next() runs the decoder, so callers
+    # must consume it off the event loop
+    segments, _info = model.transcribe(
+        audio,
+        beam_size=WHISPER_BEAM_SIZE,
+        best_of=1,
+        language=WHISPER_LANGUAGE,
+        vad_filter=WHISPER_VAD_FILTER,
+        vad_parameters=dict(min_silence_duration_ms=300),
+        condition_on_previous_text=False,
+    )
+    return segments
+
+
+def _transcribe_bytes(body: bytes) -> str:
+    return "".join(seg.text for seg in _segments(body)).strip()
+
+
+def _transcribe_batch(bodies: list[bytes]) -> list[str]:
+    audios = [_decode(body) for body in bodies]
+    n_samples = model.feature_extractor.n_samples  # 30 s at 16 kHz
+    texts: list[str | None] = [None] * len(audios)
+    short = [i for i, audio in enumerate(audios) if 0 < len(audio) <= n_samples]
+
+    if len(short) > 1:
+        tokenizer = Tokenizer(
+            model.hf_tokenizer,
+            model.model.is_multilingual,
+            task="transcribe",
+            language=WHISPER_LANGUAGE,
+        )
+        features = np.stack(
+            [
+                pad_or_trim(model.feature_extractor(audios[i]), model.feature_extractor.nb_max_frames)
+                for i in short
+            ]
+        )
+        encoder_output = model.encode(features)
+        prompt = model.get_prompt(tokenizer, [], without_timestamps=True)
+        results = model.model.generate(
+            encoder_output,
+            [prompt] * len(short),
+            beam_size=WHISPER_BEAM_SIZE,
+            max_length=model.max_length,
+            suppress_blank=True,
+            suppress_tokens=[-1],
+        )
+        for i, result in zip(short, results):
+            texts[i] = tokenizer.decode(result.sequences_ids[0]).strip()
+
+    for i, audio in enumerate(audios):
+        if texts[i] is None:
+            texts[i] = "".join(seg.text for seg in _segments_for(audio)).strip()
+    return texts
+
+
+async def _batch_worker() -> None:
+    loop = asyncio.get_running_loop()
+    window = WHISPER_BATCH_WINDOW_MS / 1000
+    while True:
+        items = [await _batch_queue.get()]
+        deadline = loop.time() + window
+        while len(items) < WHISPER_BATCH_SIZE:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(_batch_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        bodies = [body for body, _ in items]
+        try:
+            async with transcribe_semaphore:
+                texts = await loop.run_in_executor(transcribe_pool, _transcribe_batch, bodies)
+        except Exception as e:
+            logger.exception("Batched transcription failed (batch=%d)", len(items))
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        for (_, future), text in zip(items, texts):
+            if not future.done():
+                future.set_result(text)
+
+
+async def _run_transcription(body: bytes) -> str:
+    loop = asyncio.get_running_loop()
+    if _batch_queue is not None:
+        future = loop.create_future()
+        _batch_queue.put_nowait((body, future))
+        return await future
+    async with transcribe_semaphore:
+        return await loop.run_in_executor(transcribe_pool, _transcribe_bytes, body)
+
+
+def _stream_segments(
+    body: bytes,
+    loop: asyncio.AbstractEventLoop,
+    queue: asyncio.Queue,
+    stop: threading.Event,
+) -> None:
+    # Runs on transcribe_pool; hands each segment to the event loop as soon as CT2 emits it
+    try:
+        for seg in _segments(body):
+            if stop.is_set():
+                return
+            item = {"text": seg.text, "start": seg.start, "end": seg.end}
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+    except Exception as e:
+        loop.call_soon_threadsafe(queue.put_nowait, {"error": str(e)})
+    finally:
+        loop.call_soon_threadsafe(queue.put_nowait, None)
+
+
+def _ndjson_line(item: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(item) + b"\n"
+    return json.dumps(item).encode("utf-8") + b"\n"
+
+
+def _warmup() -> None:
+    # 1 s of silence through the full transcribe path so CT2 kernel selection
+    # and allocator growth happen before the first real request
+    started = time.perf_counter()
+    segments, _info = model.transcribe(
+        np.zeros(16000, dtype=np.float32), beam_size=1, language="en"
+    )
+    list(segments)
+    logger.info("Whisper warmup done in %.0f ms", (time.perf_counter() - started) * 1000)
+
+
+@app.on_event("startup")
+async def warm_model():
+    await asyncio.get_running_loop().run_in_executor(transcribe_pool, _warmup)
+
+
+@app.on_event("startup")
+async def start_batcher():
+    global _batch_queue
+    if BATCHING_ENABLED:
+        _batch_queue = asyncio.Queue()
+        asyncio.create_task(_batch_worker())
+        logger.info(
+            "Whisper micro-batching on (batch=%d window=%.0fms)",
+            WHISPER_BATCH_SIZE,
+            WHISPER_BATCH_WINDOW_MS,
+        )
+
+
+async def _transcribe_and_cache(key: bytes, body: bytes) -> str:
+    text = await _run_transcription(body)
+    if WHISPER_CACHE_MAX > 0:
+        _transcript_cache[key] = text
+        while len(_transcript_cache) > WHISPER_CACHE_MAX:
+            _transcript_cache.popitem(last=False)
+    return text
+
+
+def _inflight_done(key: bytes, task: asyncio.Task) -> None:
+    _inflight.pop(key, None)
+    if not task.cancelled():
+        task.exception()  # waiters still see it; avoids "never retrieved" noise
+
+
+async def _transcribe_cached(body: bytes) -> str:
+    key = hashlib.blake2b(body, digest_size=16).digest()
+    cached = _transcript_cache.get(key)
+    if cached is not None:
+        _transcript_cache.move_to_end(key)
+        return cached
+
+    # The decode runs detached from any one request: a caller disconnecting
+    # only cancels its own wait, never the result the other callers share.
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_transcribe_and_cache(key, body))
+        _inflight[key] = task
+        task.add_done_callback(functools.partial(_inflight_done, key))
+    return await asyncio.shield(task)
 
 
 @app.post("/transcribe")
@@ -17,27 +279,37 @@ async def transcribe(request: Request):
         # 1) Read raw bytes (WebM/Opus from browser or WAV from Node)
         body = await request.body()
 
-        # 2) Write to a temporary file with a generic extension
-        #    ffmpeg inside faster-whisper will detect the format
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as tmp:
-            tmp.write(body)
-            tmp_path = tmp.name
-
-        # 3) Transcribe with faster-whisper
-        segments, info = model.transcribe(
-            tmp_path,
-            beam_size=5,
-            language=None,  # set to "en" to force English
-        )
+        # 2) Decode + transcribe off the event loop (cached by content hash)
+        text = await _transcribe_cached(body)
 
-        text_chunks = [seg.text for seg in segments]
-        text = "".join(text_chunks).strip()
-
-        # 4) Clean up temp file
-        os.remove(tmp_path)
-
-        return JSONResponse({"text": text})
+        return {"text": text}
 
     except Exception as e:
         # Make sure we see any error clearly
-        return JSONResponse({"error": str(e)}, status_code=500)
+        return _JSONResponse({"error": str(e)}, status_code=500)
+
+
+# Same input as /transcribe, but emits one NDJSON line per segment as it is decoded,
+# so time-to-first-text is the first segment rather than the whole clip.
+@app.post("/transcribe_stream")
+async def transcribe_stream(request: Request):
+    body = await request.body()
+
+    async def gen():
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        try:
+            async with transcribe_semaphore:
+                job = loop.run_in_executor(transcribe_pool, _stream_segments, body, loop, queue, stop)
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        break
+                    yield _ndjson_line(item)
+                await job
+        finally:
+            # client went away: let the worker stop at the next segment
+            stop.set()
+
+    return StreamingResponse(gen(), media_type="application/x-ndjson")
@@ -3,12 +3,16 @@
 Download Coqui XTTS-v2 sample speaker WAVs into xtts_voices/ for default voice options.
 Run once before starting xtts_server if you want built-in voices (en_sample, es_sample, etc.).
 """
+import json
 import os
+import shutil
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Coqui XTTS-v2 samples on Hugging Face (resolve/main)
-BASE = "https://huggingface.co/coqui/XTTS-v2/resolve/main/samples"
+REPO_ID = "coqui/XTTS-v2"
+BASE = f"https://huggingface.co/{REPO_ID}/resolve/main/samples"
 SAMPLES = [
     "de_sample.wav",
     "en_sample.wav",
@@ -21,41 +25,156 @@ SAMPLES = [
 ]
 
 
+def _snapshot_samples(voices_dir: Path) -> bool:
+    """
+    Fetch all samples with one huggingface_hub snapshot_download (shared session,
+    parallel workers, revalidation via its local_dir metadata) into voices_dir/.hf,
+    then copy them into place. Returns False if the hub client is missing or fails,
+    so the caller can fall back to per-file downloads.
+    """
+    try:
+        from huggingface_hub import snapshot_download
+    except ImportError:
+        return False
+    staging = voices_dir / ".hf"
+    try:
+        snapshot_download(
+            repo_id=REPO_ID,
+            allow_patterns=[f"samples/{name}" for name in SAMPLES],
+            local_dir=staging,
+            max_workers=len(SAMPLES),
+        )
+    except Exception as e:
+        print("  snapshot_download failed, falling back to per-file downloads:", e, file=sys.stderr)
+        return False
+    if not all((staging / "samples" / name).is_file() for name in SAMPLES):
+        return False
+    for name in SAMPLES:
+        part = voices_dir / (name + ".part")
+        shutil.copyfile(staging / "samples" / name, part)
+        os.replace(part, voices_dir / name)
+        print("  ok:", name)
+    return True
+
+
+def _pool_manager(verify: bool):
+    """Keep-alive connection pool shared by all workers, or None without urllib3."""
+    try:
+        import urllib3
+    except ImportError:
+        return None
+    if verify:
+        return urllib3.PoolManager(maxsize=len(SAMPLES), cert_reqs="CERT_REQUIRED")
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    return urllib3.PoolManager(maxsize=len(SAMPLES), cert_reqs="CERT_NONE", assert_hostname=False)
+
+
+def _load_etags(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _fetch(name: str, voices_dir: Path, ctx, http, etags: dict) -> None:
+    import urllib.error
+    import urllib.request
+    path = voices_dir / name
+    # Revalidate with If-None-Match when the local file is intact (size matches what
+    # we recorded); files with no record or a size mismatch are re-downloaded
+    headers = {}
+    known = etags.get(name)
+    if path.is_file() and known and known.get("etag") and path.stat().st_size == known.get("size"):
+        headers["If-None-Match"] = known["etag"]
+    url = f"{BASE}/{name}"
+    # Stream in 64 KiB chunks to a .part file, then rename, so memory stays flat
+    # and an interrupted download is never mistaken for a finished one
+    part = path.with_name(path.name + ".part")
+    try:
+        if http is not None:
+            resp = http.request("GET", url, headers=headers, preload_content=False, timeout=30.0)
+            try:
+                if resp.status == 304:
+                    print("  skip (unchanged):", name)
+                    return
+                if resp.status != 200:
+                    raise RuntimeError(f"HTTP {resp.status}")
+                etag = resp.headers.get("ETag")
+                with open(part, "wb", buffering=1 << 17) as f:
+                    shutil.copyfileobj(resp, f, length=1 << 16)
+            finally:
+                resp.release_conn()
+        else:
+            req = urllib.request.Request(url, headers=headers)
+            try:
+                with urllib.request.urlopen(req, timeout=30, context=ctx) as resp, \
+                        open(part, "wb", buffering=1 << 17) as f:
+                    etag = resp.headers.get("ETag")
+                    shutil.copyfileobj(resp, f, length=1 << 16)
+            except urllib.error.HTTPError as e:
+                if e.code != 304:
+                    raise
+                print("  skip (unchanged):", name)
+                return
+        os.replace(part, path)
+        etags[name] = {"etag": etag, "size": path.stat().st_size}
+        print("  ok:", name)
+    except Exception as e:
+        part.unlink(missing_ok=True)
+        print("  failed:", name, e, file=sys.stderr)
+
+
+def _tls_verifies(ctx) -> bool:
+    """
+    HEAD the first sample with the verifying context. Only a certificate/TLS failure
+    counts against it: any HTTP status (even 403/404) means the handshake verified,
+    and other network errors are left for the downloads themselves to report.
+    """
+    import ssl
+    import urllib.error
+    import urllib.request
+    req = urllib.request.Request(f"{BASE}/{SAMPLES[0]}", method="HEAD")
+    try:
+        urllib.request.urlopen(req, timeout=5, context=ctx).close()
+    except ssl.SSLError:
+        return False
+    except urllib.error.HTTPError:
+        return True
+    except urllib.error.URLError as e:
+        return not isinstance(e.reason, ssl.SSLError)
+    return True
+
+
 def main():
     base_dir = Path(__file__).resolve().parent
     voices_dir = Path(os.getenv("XTTS_VOICES_DIR", str(base_dir / "xtts_voices")))
     voices_dir.mkdir(parents=True, exist_ok=True)
 
     import ssl
-    import urllib.request
-    import urllib.error
     print("Downloading XTTS default voices to", voices_dir)
     # macOS Python often lacks certs; try default first, then unverified
     ctx = ssl.create_default_context()
-    try:
-        urllib.request.urlopen(f"{BASE}/", timeout=5, context=ctx)
-    except (ssl.SSLError, urllib.error.URLError):
+    verify = _tls_verifies(ctx)
+    if not verify:
         ctx = ssl._create_unverified_context()
         print("  (using SSL fallback; run Install Certificates.command for your Python to fix)", file=sys.stderr)
-    for name in SAMPLES:
-        path = voices_dir / name
-        if path.is_file():
-            print("  skip (exists):", name)
-            continue
-        url = f"{BASE}/{name}"
-        try:
-            with urllib.request.urlopen(url, timeout=30, context=ctx) as resp:
-                path.write_bytes(resp.read())
-            print("  ok:", name)
-        except Exception as e:
-            print("  failed:", name, e, file=sys.stderr)
+    # huggingface_hub (installed with TTS/transformers) handles the whole set in one call
+    if not (verify and _snapshot_samples(voices_dir)):
+        # Reuse TLS connections across samples when urllib3 is available (it ships with TTS)
+        http = _pool_manager(verify)
+        # name -> {etag, size} from previous runs, for conditional GETs
+        etags_path = voices_dir / ".etags.json"
+        etags = _load_etags(etags_path)
+        # Downloads are latency-bound (TLS + CDN round trips); overlap them
+        with ThreadPoolExecutor(max_workers=len(SAMPLES)) as pool:
+            list(pool.map(lambda name: _fetch(name, voices_dir, ctx, http, etags), SAMPLES))
+        etags_path.write_text(json.dumps(etags, indent=2, sort_keys=True))
 
     # So server fallback "default_voice.wav" works when no voice_id is sent
     default_voice = voices_dir / "default_voice.wav"
     en_sample = voices_dir / "en_sample.wav"
     if not default_voice.is_file() and en_sample.is_file():
-        import shutil
-        shutil.copy2(en_sample, default_voice)
+        shutil.copyfile(en_sample, default_voice)
         print("  default_voice.wav (copy of en_sample.wav)")
     print("Done. Start xtts_server and use GET /voices to list voice_id options.")
 
@@ -1,24 +1,24 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse, Response
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
 from kokoro_onnx import Kokoro
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
 from starlette.concurrency import run_in_threadpool
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import asyncio
+import functools
+import hashlib
 import logging
-import soundfile as sf
-import io
+import multiprocessing
+import numpy as np
 import os
+import struct
+import time
 
-# Rate limiting
-RATE_LIMIT = os.getenv("RATE_LIMIT_PER_MINUTE", "30")
-limiter = Limiter(key_func=get_remote_address)
-
-app = FastAPI()
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+try:
+    from kokoro_onnx.trim import trim as _trim_audio
+except ImportError:  # older kokoro_onnx: /tts_stream falls back to full synthesis
+    _trim_audio = None
 
 logger = logging.getLogger("kokoro_server")
 
@@ -30,30 +30,165 @@ KOKORO_MAX_CONCURRENT = int(os.getenv("KOKORO_MAX_CONCURRENT", "2"))
 KOKORO_MIN_SPEED = float(os.getenv("KOKORO_MIN_SPEED", "0.5"))
 KOKORO_MAX_SPEED = float(os.getenv("KOKORO_MAX_SPEED", "1.5"))
 KOKORO_DEVICE = os.getenv("KOKORO_DEVICE")
+KOKORO_CACHE_MAX = int(os.getenv("KOKORO_CACHE_MAX", "256"))
+# "thread" (default): synth in Starlette's threadpool in this process.
+# "process": KOKORO_MAX_CONCURRENT worker processes, each with its own Kokoro, so
+# phonemization and the Python around ORT are not serialized on one GIL
+# (costs one model copy of RAM per worker).
+KOKORO_EXECUTOR = os.getenv("KOKORO_EXECUTOR", "thread").lower()
+KOKORO_INTRA_OP_THREADS = int(os.getenv("KOKORO_INTRA_OP_THREADS", str(max(1, (os.cpu_count() or 2) // 2))))
 
-# Load Kokoro model + voices at startup (configurable for future GPU use).
-if KOKORO_DEVICE:
-    try:
-        kokoro = Kokoro(KOKORO_MODEL_PATH, KOKORO_VOICES_PATH, device=KOKORO_DEVICE)
-    except TypeError:
+app = FastAPI()
+
+# Rate limiting: per-client token bucket (RATE_LIMIT tokens, refilled over a minute)
+# on the synthesis routes. Only touched from the event loop, so no lock is needed.
+RATE_LIMIT = int(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))
+_RATE_LIMITED_PATHS = frozenset({"/tts", "/tts_stream"})
+_BUCKETS_MAX = 10000
+# host -> [tokens, last_refill], least recently seen first
+_buckets: "OrderedDict[str, list[float]]" = OrderedDict()
+
+
+@app.middleware("http")
+async def rate_limit(request: Request, call_next):
+    if RATE_LIMIT > 0 and request.url.path in _RATE_LIMITED_PATHS:
+        host = request.client.host if request.client else "unknown"
+        now = time.monotonic()
+        bucket = _buckets.get(host)
+        if bucket is None:
+            # evict the stalest hosts; clearing would reset every client's limit
+            while len(_buckets) >= _BUCKETS_MAX:
+                _buckets.popitem(last=False)
+            bucket = _buckets[host] = [float(RATE_LIMIT), now]
+        else:
+            _buckets.move_to_end(host)
+        tokens = min(float(RATE_LIMIT), bucket[0] + (now - bucket[1]) * RATE_LIMIT / 60.0)
+        bucket[1] = now
+        if tokens < 1.0:
+            bucket[0] = tokens
+            return JSONResponse(
+                {"error": f"Rate limit exceeded: {RATE_LIMIT} per 1 minute"}, status_code=429
+            )
+        bucket[0] = tokens - 1.0
+    return await call_next(request)
+
+
+# KOKORO_DEVICE -> onnxruntime execution providers (unset: CUDA when available, else CPU).
+# For CPU int8, point KOKORO_MODEL_PATH at the quantized kokoro-v1.0.int8.onnx release.
+_ORT_PROVIDERS = {
+    "cpu": ["CPUExecutionProvider"],
+    "cuda": ["CUDAExecutionProvider", "CPUExecutionProvider"],
+    "gpu": ["CUDAExecutionProvider", "CPUExecutionProvider"],
+}
+
+
+def _load_kokoro() -> tuple[Kokoro, list[str]]:
+    if not hasattr(Kokoro, "from_session"):
+        if KOKORO_DEVICE:
+            logger.warning(
+                "KOKORO_DEVICE set but kokoro_onnx does not support from_session; using default device"
+            )
+        return Kokoro(KOKORO_MODEL_PATH, KOKORO_VOICES_PATH), []
+
+    import onnxruntime as ort
+
+    wanted = _ORT_PROVIDERS.get((KOKORO_DEVICE or "").lower())
+    if wanted is None:
+        if KOKORO_DEVICE:
+            logger.warning("Unknown KOKORO_DEVICE=%s; picking providers automatically", KOKORO_DEVICE)
+        wanted = _ORT_PROVIDERS["cuda"]
+    available = set(ort.get_available_providers())
+    providers = [p for p in wanted if p in available] or ["CPUExecutionProvider"]
+    if KOKORO_DEVICE and providers != wanted:
         logger.warning(
-            "KOKORO_DEVICE set but kokoro_onnx does not support device arg; using default device"
+            "KOKORO_DEVICE=%s requested %s; available providers: %s",
+            KOKORO_DEVICE, wanted, sorted(available),
         )
-        kokoro = Kokoro(KOKORO_MODEL_PATH, KOKORO_VOICES_PATH)
-else:
-    kokoro = Kokoro(KOKORO_MODEL_PATH, KOKORO_VOICES_PATH)
+
+    so = ort.SessionOptions()
+    so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    so.intra_op_num_threads = KOKORO_INTRA_OP_THREADS
+    session = ort.InferenceSession(KOKORO_MODEL_PATH, sess_options=so, providers=providers)
+    return Kokoro.from_session(session, KOKORO_VOICES_PATH), providers
+
+
+def _preload_voices(k: Kokoro) -> None:
+    """
+    kokoro_onnx keeps voices-v1.0.bin as a lazy np.load() NpzFile, so every
+    create() re-reads (and re-inflates) the voice from the zip. Materialize all
+    voice arrays once so lookups are a dict hit.
+    """
+    voices = getattr(k, "voices", None)
+    if voices is None or not hasattr(voices, "files"):
+        return
+    k.voices = {name: voices[name] for name in voices.files}
+    voices.close()
+    logger.info("Preloaded %d Kokoro voices from %s", len(k.voices), KOKORO_VOICES_PATH)
+
+
+def _init_worker() -> None:
+    global kokoro, KOKORO_PROVIDERS
+    kokoro, KOKORO_PROVIDERS = _load_kokoro()
+    _preload_voices(kokoro)
+
+
+# Load Kokoro model + voices at startup (process mode loads it in each worker instead;
+# spawned workers re-import this module, so this must stay conditional)
+kokoro = None
+KOKORO_PROVIDERS: list[str] = []
+if KOKORO_EXECUTOR != "process":
+    _init_worker()
 
 tts_semaphore = asyncio.Semaphore(KOKORO_MAX_CONCURRENT)
+_process_pool: ProcessPoolExecutor | None = None
+
+# Greetings and stock prompts repeat across calls; keep recent WAVs in an LRU and
+# let concurrent identical requests share one synthesis.
+# Only touched from the event loop, so no lock is needed.
+_wav_cache: "OrderedDict[bytes, bytes]" = OrderedDict()
+_inflight: dict[bytes, asyncio.Task] = {}
+
+
+def _cache_key(text: str, voice: str, speed: float) -> bytes:
+    return hashlib.blake2b(f"{voice}|{speed}|{text}".encode("utf-8"), digest_size=16).digest()
 
 
 class TTSRequest(BaseModel):
-    text: str
+    # Bounds are enforced by pydantic-core while parsing, before the handler runs
+    # (violations are 422s); unknown fields from the Node side are dropped.
+    model_config = {
+        "extra": "ignore",
+        "str_strip_whitespace": True,
+        "str_max_length": KOKORO_MAX_TEXT_CHARS,
+    }
+
+    text: str = Field(min_length=1, max_length=KOKORO_MAX_TEXT_CHARS)
     voice_id: str | None = KOKORO_DEFAULT_VOICE  # default voice if client doesn't send one
 
     # new tuning fields (match what your Node code sends)
-    rate: float | None = 1.0       # maps to Kokoro "speed"
-    energy: float | None = 1.0     # currently unused, placeholder
-    variation: float | None = 1.0  # currently unused, placeholder
+    rate: float | None = Field(default=1.0, ge=KOKORO_MIN_SPEED, le=KOKORO_MAX_SPEED)  # Kokoro "speed"
+    energy: float | None = None     # currently unused, placeholder
+    variation: float | None = None  # currently unused, placeholder
+
+
+_WAV_UNKNOWN_SIZE = 0xFFFFFFFF  # streaming: length not known when the header is sent
+_STREAM_CHUNK_BYTES = 8192  # 4096 PCM16 samples
+
+
+def _riff_header(data_bytes: int, sample_rate: int, channels: int = 1, bits: int = 16) -> bytes:
+    """44-byte canonical PCM WAV header."""
+    block_align = channels * bits // 8
+    riff_size = _WAV_UNKNOWN_SIZE if data_bytes == _WAV_UNKNOWN_SIZE else 36 + data_bytes
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", riff_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, bits,
+        b"data", data_bytes,
+    )
+
+
+def _to_pcm16(samples) -> bytes:
+    return (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
 
 
 def _synthesize_wav(text: str, voice: str, speed: float) -> bytes:
@@ -62,9 +197,83 @@ def _synthesize_wav(text: str, voice: str, speed: float) -> bytes:
         voice=voice,
         speed=speed,
     )
-    buf = io.BytesIO()
-    sf.write(buf, samples, sample_rate, format="WAV")
-    return buf.getvalue()
+    # mono PCM16 WAV, built directly instead of going through libsndfile
+    pcm = _to_pcm16(samples)
+    return _riff_header(len(pcm), sample_rate) + pcm
+
+
+async def _run_synthesis(text: str, voice: str, speed: float) -> bytes:
+    async with tts_semaphore:
+        if _process_pool is not None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(_process_pool, _synthesize_wav, text, voice, speed)
+        return await run_in_threadpool(_synthesize_wav, text, voice, speed)
+
+
+async def _synthesize_and_cache(key: bytes, text: str, voice: str, speed: float) -> bytes:
+    wav_bytes = await _run_synthesis(text, voice, speed)
+    if KOKORO_CACHE_MAX > 0:
+        _wav_cache[key] = wav_bytes
+        while len(_wav_cache) > KOKORO_CACHE_MAX:
+            _wav_cache.popitem(last=False)
+    return wav_bytes
+
+
+def _inflight_done(key: bytes, task: asyncio.Task) -> None:
+    _inflight.pop(key, None)
+    if not task.cancelled():
+        task.exception()  # waiters still see it; avoids "never retrieved" noise
+
+
+async def _synthesize_cached(text: str, voice: str, speed: float) -> bytes:
+    key = _cache_key(text, voice, speed)
+    wav_bytes = _wav_cache.get(key)
+    if wav_bytes is not None:
+        _wav_cache.move_to_end(key)
+        return wav_bytes
+
+    # The synthesis runs detached from any one request: a caller hanging up
+    # only cancels its own wait, never the result the other callers share.
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_synthesize_and_cache(key, text, voice, speed))
+        _inflight[key] = task
+        task.add_done_callback(functools.partial(_inflight_done, key))
+    return await asyncio.shield(task)
+
+
+@app.on_event("startup")
+async def start_executor():
+    global _process_pool
+    if KOKORO_EXECUTOR == "process":
+        # spawn, not fork: onnxruntime thread pools do not survive fork
+        _process_pool = ProcessPoolExecutor(
+            max_workers=KOKORO_MAX_CONCURRENT,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+
+@app.on_event("shutdown")
+async def stop_executor():
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+
+
+@app.on_event("startup")
+async def warm_kokoro():
+    # Throwaway synthesis so ORT allocators and the default voice are resident
+    # before the first real call (cold synth can take seconds on CPU); in process
+    # mode this brings up and warms every worker
+    started = time.perf_counter()
+    try:
+        workers = KOKORO_MAX_CONCURRENT if _process_pool is not None else 1
+        await asyncio.gather(
+            *(_run_synthesis("warm up.", KOKORO_DEFAULT_VOICE, 1.0) for _ in range(workers))
+        )
+        logger.info("Kokoro warmup done in %.0f ms", (time.perf_counter() - started) * 1000)
+    except Exception:
+        logger.exception("Kokoro warmup failed for voice=%s", KOKORO_DEFAULT_VOICE)
 
 
 @app.get("/health")
@@ -74,37 +283,88 @@ def health():
         "model": KOKORO_MODEL_PATH,
         "voices": KOKORO_VOICES_PATH,
         "device": KOKORO_DEVICE or "default",
+        "providers": KOKORO_PROVIDERS,
+        "executor": KOKORO_EXECUTOR,
     }
 
 
+def _parse_request(req: TTSRequest) -> tuple[str, str, float]:
+    # text/rate are already stripped and bounds-checked by TTSRequest
+    # voice: use what the client sends, fall back to default
+    voice = req.voice_id or KOKORO_DEFAULT_VOICE
+
+    # map rate -> speed for Kokoro
+    speed = req.rate if req.rate is not None else 1.0
+
+    # (energy / variation are accepted but not used for now)
+    # You *could* later use them to choose different voices
+    # or tweak text shaping on the Node side.
+
+    # quantize so 1.0 and 1.0000001 share a cache entry
+    return req.text, voice, round(speed, 2)
+
+
 @app.post("/tts")
-@limiter.limit(f"{RATE_LIMIT}/minute")
-async def synthesize(request: Request, req: TTSRequest):
+async def synthesize(req: TTSRequest):
     try:
-        text = (req.text or "").strip()
-        if not text:
-            return JSONResponse({"error": "text is required"}, status_code=400)
-        if len(text) > KOKORO_MAX_TEXT_CHARS:
-            return JSONResponse({"error": "text too long"}, status_code=413)
-
-        # voice: use what the client sends, fall back to default
-        voice = req.voice_id or KOKORO_DEFAULT_VOICE
-
-        # map rate -> speed for Kokoro
-        speed = req.rate if req.rate is not None else 1.0
-        if speed < KOKORO_MIN_SPEED:
-            speed = KOKORO_MIN_SPEED
-        if speed > KOKORO_MAX_SPEED:
-            speed = KOKORO_MAX_SPEED
-
-        # (energy / variation are accepted but not used for now)
-        # You *could* later use them to choose different voices
-        # or tweak text shaping on the Node side.
-
-        async with tts_semaphore:
-            wav_bytes = await run_in_threadpool(_synthesize_wav, text, voice, speed)
+        text, voice, speed = _parse_request(req)
 
+        wav_bytes = await _synthesize_cached(text, voice, speed)
         return Response(content=wav_bytes, media_type="audio/wav")
     except Exception:
         logger.exception("TTS synthesis failed")
         return JSONResponse({"error": "TTS synthesis failed"}, status_code=500)
+
+
+def _phoneme_batches(text: str, voice: str) -> tuple[list[str], np.ndarray]:
+    # Same split Kokoro.create() / create_stream() use
+    style = kokoro.get_voice_style(voice)
+    return kokoro._split_phonemes(kokoro.tokenizer.phonemize(text, "en-us")), style
+
+
+def _synthesize_batch(phonemes: str, style: np.ndarray, speed: float) -> tuple[bytes, int]:
+    samples, sample_rate = kokoro._create_audio(phonemes, style, speed)
+    samples, _ = _trim_audio(samples)
+    return _to_pcm16(samples), sample_rate
+
+
+def _batch_streamable() -> bool:
+    return (
+        kokoro is not None
+        and _trim_audio is not None
+        and hasattr(kokoro, "_split_phonemes")
+        and hasattr(kokoro, "_create_audio")
+    )
+
+
+async def _iter_wav(text: str, voice: str, speed: float):
+    key = _cache_key(text, voice, speed)
+    if _batch_streamable() and key not in _wav_cache and key not in _inflight:
+        # header first (length unknown), then PCM as each phoneme batch is synthesized.
+        # Batches are driven here rather than through kokoro.create_stream(), whose
+        # detached task keeps synthesizing on the default executor after the client
+        # leaves and the semaphore is released; here a disconnect stops the loop.
+        header_sent = False
+        async with tts_semaphore:
+            batches, style = await run_in_threadpool(_phoneme_batches, text, voice)
+            for phonemes in batches:
+                pcm, sample_rate = await run_in_threadpool(_synthesize_batch, phonemes, style, speed)
+                if not header_sent:
+                    yield _riff_header(_WAV_UNKNOWN_SIZE, sample_rate)
+                    header_sent = True
+                for i in range(0, len(pcm), _STREAM_CHUNK_BYTES):
+                    yield pcm[i:i + _STREAM_CHUNK_BYTES]
+        return
+
+    # cached or already in flight, or process mode / older kokoro_onnx:
+    # full synth, then chunked send
+    wav_bytes = await _synthesize_cached(text, voice, speed)
+    for i in range(0, len(wav_bytes), _STREAM_CHUNK_BYTES):
+        yield wav_bytes[i:i + _STREAM_CHUNK_BYTES]
+
+
+# Same request body as /tts; streams the WAV so playback can start before synthesis ends.
+# The header carries 0xFFFFFFFF sizes, so clients must read until EOF.
+@app.post("/tts_stream")
+async def synthesize_stream(req: TTSRequest):
+    return StreamingResponse(_iter_wav(*_parse_request(req)), media_type="audio/wav")
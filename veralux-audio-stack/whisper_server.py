@@ -1,35 +1,106 @@
 from fastapi import FastAPI, Request, UploadFile, File
-from fastapi.responses import JSONResponse
-from faster_whisper import WhisperModel
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from faster_whisper import BatchedInferencePipeline, WhisperModel, decode_audio
+from faster_whisper.vad import get_vad_model
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from starlette.concurrency import run_in_threadpool
+from collections import OrderedDict
 import asyncio
+import ctranslate2
+import hashlib
 import logging
-import tempfile
+import numpy as np
+import orjson
 import os
-from pathlib import Path
+import tempfile
+import threading
+from typing import BinaryIO
 
 # Rate limiting
 RATE_LIMIT = os.getenv("RATE_LIMIT_PER_MINUTE", "30")
 limiter = Limiter(key_func=get_remote_address)
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 logger = logging.getLogger("whisper_server")
 
 MAX_BODY_BYTES = int(os.getenv("WHISPER_MAX_BODY_BYTES", str(25 * 1024 * 1024)))
+# Raw uploads are spooled in RAM up to this size, then roll over to a file in
+# WHISPER_TMP_DIR (tmpfs by default, so large bodies still never hit disk).
+SPOOL_MAX_BYTES = 2 * 1024 * 1024
+
+
+def _default_tmp_dir() -> str | None:
+    # Spooling happens before the transcribe semaphore, so tmpfs must hold several
+    # max-size bodies at once. Docker's default 64 MB /dev/shm doesn't; use the
+    # regular temp dir there rather than fail uploads with ENOSPC.
+    try:
+        st = os.statvfs("/dev/shm")
+    except OSError:
+        return None
+    return "/dev/shm" if st.f_frsize * st.f_blocks >= 8 * MAX_BODY_BYTES else None
+
+
+WHISPER_TMP_DIR = os.getenv("WHISPER_TMP_DIR") or _default_tmp_dir()
 MAX_CONCURRENT = int(os.getenv("WHISPER_MAX_CONCURRENT", "2"))
-WHISPER_MODEL = os.getenv("WHISPER_MODEL", "small")
+# Distilled / turbo checkpoints keep the encoder but cut decoder layers, which
+# dominate latency. An explicit WHISPER_MODEL always wins over the variant.
+_MODEL_VARIANTS = {
+    "distil": "distil-small.en",
+    "turbo": "large-v3-turbo",
+}
+WHISPER_MODEL_VARIANT = os.getenv("WHISPER_MODEL_VARIANT", "distil").strip().lower()
+WHISPER_MODEL = os.getenv("WHISPER_MODEL") or _MODEL_VARIANTS.get(
+    WHISPER_MODEL_VARIANT, WHISPER_MODEL_VARIANT
+)
 WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "cpu")
-WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+
+
+def _default_compute_type(device: str) -> str:
+    # int8 weights with 16-bit activations where the CPU has the kernels
+    # (AVX-512 VNNI/BF16, AMX, ARM i8mm); plain int8 everywhere else.
+    if device == "cuda":
+        return "int8_float16"
+    try:
+        supported = ctranslate2.get_supported_compute_types("cpu")
+    except Exception:
+        return "int8"
+    for compute_type in ("int8_float16", "int8_bfloat16"):
+        if compute_type in supported:
+            return compute_type
+    return "int8"
+
+
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE") or _default_compute_type(WHISPER_DEVICE)
 WHISPER_BEAM_SIZE = int(os.getenv("WHISPER_BEAM_SIZE", "1"))
-WHISPER_LANGUAGE = os.getenv("WHISPER_LANGUAGE", "en")
+# Receptionist audio is single-language: a fixed language skips the 30 s
+# detection pass. Set WHISPER_LANGUAGE to an empty string to auto-detect.
+WHISPER_LANGUAGE = os.getenv("WHISPER_LANGUAGE", "en").strip() or None
 WHISPER_VAD_FILTER = os.getenv("WHISPER_VAD_FILTER", "true").lower() in {"1", "true", "yes"}
 WHISPER_ALLOW_FALLBACK = os.getenv("WHISPER_ALLOW_FALLBACK", "true").lower() in {"1", "true", "yes"}
+# One CTranslate2 worker per allowed concurrent request, each with its share of
+# the cores, so parallel transcriptions neither queue inside CT2 nor
+# oversubscribe the CPU.
+WHISPER_NUM_WORKERS = int(os.getenv("WHISPER_NUM_WORKERS", str(MAX_CONCURRENT)))
+# gunicorn's WEB_CONCURRENCY server processes each load their own model.
+_SERVER_PROCESSES = int(os.getenv("WEB_CONCURRENCY") or "1")
+WHISPER_CPU_THREADS = int(
+    os.getenv(
+        "WHISPER_CPU_THREADS",
+        str(max(1, (os.cpu_count() or 1) // max(1, _SERVER_PROCESSES * WHISPER_NUM_WORKERS))),
+    )
+)
+WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "1"))
+# A clip whose loudest 30 ms frame (RMS, float PCM) stays below this is treated
+# as silence and never reaches the encoder; ~200 on the int16 scale. Gating on
+# the peak frame rather than the whole-clip average keeps a short quiet answer
+# in a long capture from being dropped. 0 disables the check.
+WHISPER_SILENCE_THRESHOLD = float(os.getenv("WHISPER_SILENCE_THRESHOLD", str(200 / 32768)))
+_SILENCE_FRAME = 480  # 30 ms at 16 kHz
 
 # Load Whisper model once at startup (configurable for future GPU use).
 try:
@@ -37,6 +108,8 @@ try:
         WHISPER_MODEL,
         device=WHISPER_DEVICE,
         compute_type=WHISPER_COMPUTE_TYPE,
+        cpu_threads=WHISPER_CPU_THREADS,
+        num_workers=WHISPER_NUM_WORKERS,
     )
 except Exception:
     if WHISPER_DEVICE != "cpu" and WHISPER_ALLOW_FALLBACK:
@@ -47,49 +120,125 @@ except Exception:
         model = WhisperModel(
             WHISPER_MODEL,
             device="cpu",
-            compute_type="int8",
+            compute_type=_default_compute_type("cpu"),
+            cpu_threads=WHISPER_CPU_THREADS,
+            num_workers=WHISPER_NUM_WORKERS,
         )
     else:
         raise
 
+# faster-whisper keeps one Silero VAD session per process (lru_cache); load it
+# with the model so the first request doesn't pay the ONNX session setup.
+if WHISPER_VAD_FILTER:
+    get_vad_model()
+
+# Opt-in: split each clip on VAD boundaries and run the chunks through the
+# encoder and decoder as one batch instead of one 30 s window at a time. Only
+# long clips benefit, and the chunking relies on VAD, so it needs vad_filter.
+batched_model = (
+    BatchedInferencePipeline(model=model)
+    if WHISPER_BATCH_SIZE > 1 and WHISPER_VAD_FILTER
+    else None
+)
+
 transcribe_semaphore = asyncio.Semaphore(MAX_CONCURRENT)
 
+# Retries and reconnects often re-send the exact same clip: remember recent
+# transcripts by content hash. Only touched from the event loop, so no lock.
+WHISPER_CACHE_MAX = int(os.getenv("WHISPER_CACHE_MAX", "256"))
+_transcript_cache: "OrderedDict[bytes, str]" = OrderedDict()
 
-def _transcribe_file(path: str) -> str:
-    segments, _info = model.transcribe(
-        path,
-        beam_size=WHISPER_BEAM_SIZE,
-        language=WHISPER_LANGUAGE,
-        vad_filter=WHISPER_VAD_FILTER,
-    )
-    text_chunks = [seg.text for seg in segments]
-    return "".join(text_chunks).strip()
-
-
-def _choose_suffix(content_type: str | None, filename: str | None) -> str:
-    """
-    faster-whisper uses PyAV under the hood; container hints matter.
-    Use filename extension when available, otherwise infer from Content-Type.
-    """
-    if filename:
-        suf = Path(filename).suffix.lower()
-        if suf in {".wav", ".webm", ".mp3", ".m4a", ".ogg", ".flac"}:
-            return suf
-
-    ct = (content_type or "").lower()
-    if "wav" in ct:
-        return ".wav"
-    if "webm" in ct:
-        return ".webm"
-    if "mpeg" in ct or "mp3" in ct:
-        return ".mp3"
-    if "ogg" in ct:
-        return ".ogg"
-    if "flac" in ct:
-        return ".flac"
-
-    # Default to wav because your runtime commonly sends wav
-    return ".wav"
+
+def _is_silent(audio: np.ndarray) -> bool:
+    if not audio.size:
+        return True
+    if WHISPER_SILENCE_THRESHOLD <= 0:
+        return False
+    usable = len(audio) // _SILENCE_FRAME * _SILENCE_FRAME
+    frames = audio[:usable].reshape(-1, _SILENCE_FRAME) if usable else audio.reshape(1, -1)
+    peak_power = np.einsum("ij,ij->i", frames, frames).max() / frames.shape[1]
+    return peak_power < WHISPER_SILENCE_THRESHOLD ** 2
+
+
+def _segments(source: BinaryIO, timestamps: bool = False):
+    # Decode in-process to 16 kHz mono float32 (PyAV sniffs the container
+    # from the stream), so there is no temp file write/read/unlink per request.
+    audio = decode_audio(source, sampling_rate=16000)
+    if _is_silent(audio):
+        return []
+    if batched_model is not None:
+        segments, _info = batched_model.transcribe(
+            audio,
+            batch_size=WHISPER_BATCH_SIZE,
+            beam_size=WHISPER_BEAM_SIZE,
+            language=WHISPER_LANGUAGE,
+            task="transcribe",
+            vad_filter=True,
+        )
+    else:
+        segments, _info = model.transcribe(
+            audio,
+            beam_size=WHISPER_BEAM_SIZE,
+            language=WHISPER_LANGUAGE,
+            task="transcribe",
+            vad_filter=WHISPER_VAD_FILTER,
+            # Plain transcripts skip timestamp token decoding. Streaming needs
+            # them: without timestamps CT2 emits one segment per 30 s window,
+            # so a short call would arrive as a single line at the end.
+            without_timestamps=not timestamps,
+        )
+    # segments is a lazy generator: each next() runs the decoder, so callers
+    # must consume it off the event loop
+    return segments
+
+
+def _transcribe_audio(source: BinaryIO) -> str:
+    return "".join(seg.text for seg in _segments(source)).strip()
+
+
+def _stream_segments(
+    source: BinaryIO,
+    loop: asyncio.AbstractEventLoop,
+    queue: asyncio.Queue,
+    stop: threading.Event,
+) -> None:
+    # Runs in the threadpool; hands each segment to the event loop as soon as CT2 emits it
+    try:
+        for seg in _segments(source, timestamps=True):
+            if stop.is_set():
+                return
+            item = {"text": seg.text, "start": seg.start, "end": seg.end}
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+    except Exception:
+        logger.exception("Streaming transcription failed")
+        loop.call_soon_threadsafe(queue.put_nowait, {"error": "Transcription failed"})
+    finally:
+        source.close()
+        loop.call_soon_threadsafe(queue.put_nowait, None)
+
+
+def _digest_file(source: BinaryIO) -> bytes:
+    hasher = hashlib.blake2b(digest_size=16)
+    while chunk := source.read(1024 * 1024):
+        hasher.update(chunk)
+    source.seek(0)
+    return hasher.digest()
+
+
+async def _transcribe_cached(key: bytes, source: BinaryIO) -> str:
+    cached = _transcript_cache.get(key)
+    if cached is not None:
+        _transcript_cache.move_to_end(key)
+        return cached
+
+    async with transcribe_semaphore:
+        text = await run_in_threadpool(_transcribe_audio, source)
+
+    if WHISPER_CACHE_MAX > 0:
+        _transcript_cache[key] = text
+        while len(_transcript_cache) > WHISPER_CACHE_MAX:
+            _transcript_cache.popitem(last=False)
+    return text
 
 
 @app.get("/health")
@@ -105,74 +254,99 @@ def health():
 @app.post("/transcribe")
 @limiter.limit(f"{RATE_LIMIT}/minute")
 async def transcribe(request: Request):
-    tmp_path = None
     try:
         content_length = request.headers.get("content-length")
         if content_length:
             try:
                 if int(content_length) > MAX_BODY_BYTES:
-                    return JSONResponse({"error": "Audio payload too large"}, status_code=413)
+                    return ORJSONResponse({"error": "Audio payload too large"}, status_code=413)
             except ValueError:
-                return JSONResponse({"error": "Invalid Content-Length header"}, status_code=400)
-
-        body = await request.body()
-        if not body:
-            return JSONResponse({"error": "Empty request body"}, status_code=400)
-        if len(body) > MAX_BODY_BYTES:
-            return JSONResponse({"error": "Audio payload too large"}, status_code=413)
+                return ORJSONResponse({"error": "Invalid Content-Length header"}, status_code=400)
 
-        # Pick suffix based on Content-Type (DO NOT force .webm)
-        suffix = _choose_suffix(request.headers.get("content-type"), None)
+        # Stream into a spooled buffer so oversized uploads abort early and the
+        # payload is never held as a second bytes copy.
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, dir=WHISPER_TMP_DIR) as buf:
+            total = 0
+            hasher = hashlib.blake2b(digest_size=16)
+            async for chunk in request.stream():
+                total += len(chunk)
+                if total > MAX_BODY_BYTES:
+                    return ORJSONResponse({"error": "Audio payload too large"}, status_code=413)
+                buf.write(chunk)
+                hasher.update(chunk)
+            if not total:
+                return ORJSONResponse({"error": "Empty request body"}, status_code=400)
+            buf.seek(0)
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(body)
-            tmp_path = tmp.name
+            text = await _transcribe_cached(hasher.digest(), buf)
 
-        async with transcribe_semaphore:
-            text = await run_in_threadpool(_transcribe_file, tmp_path)
-
-        return JSONResponse({"text": text})
+        return ORJSONResponse({"text": text})
 
     except Exception:
         logger.exception("Transcription failed")
-        return JSONResponse({"error": "Transcription failed"}, status_code=500)
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.remove(tmp_path)
-            except OSError:
-                logger.warning("Failed to remove temp file: %s", tmp_path)
+        return ORJSONResponse({"error": "Transcription failed"}, status_code=500)
 
 
 # ---- MULTIPART endpoint (matches your curl: -F file=@... )
 @app.post("/transcribe_file")
 @limiter.limit(f"{RATE_LIMIT}/minute")
 async def transcribe_file(request: Request, file: UploadFile = File(...)):
-    tmp_path = None
     try:
-        data = await file.read()
-        if not data:
-            return JSONResponse({"error": "Empty file"}, status_code=400)
-        if len(data) > MAX_BODY_BYTES:
-            return JSONResponse({"error": "Audio payload too large"}, status_code=413)
+        # The multipart parser already spooled the part; decode from it directly.
+        size = file.file.seek(0, os.SEEK_END)
+        if not size:
+            return ORJSONResponse({"error": "Empty file"}, status_code=400)
+        if size > MAX_BODY_BYTES:
+            return ORJSONResponse({"error": "Audio payload too large"}, status_code=413)
+        file.file.seek(0)
 
-        suffix = _choose_suffix(file.content_type, file.filename)
+        key = await run_in_threadpool(_digest_file, file.file)
+        text = await _transcribe_cached(key, file.file)
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(data)
-            tmp_path = tmp.name
-
-        async with transcribe_semaphore:
-            text = await run_in_threadpool(_transcribe_file, tmp_path)
-
-        return JSONResponse({"text": text})
+        return ORJSONResponse({"text": text})
 
     except Exception:
         logger.exception("Transcription failed")
-        return JSONResponse({"error": "Transcription failed"}, status_code=500)
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.remove(tmp_path)
-            except OSError:
-                logger.warning("Failed to remove temp file: %s", tmp_path)
+        return ORJSONResponse({"error": "Transcription failed"}, status_code=500)
+
+
+# ---- NDJSON streaming endpoint: one {"text", "start", "end"} line per segment as
+# it is decoded, so long clips don't wait for the full transcript.
+@app.post("/transcribe_stream")
+@limiter.limit(f"{RATE_LIMIT}/minute")
+async def transcribe_stream(request: Request):
+    buf = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, dir=WHISPER_TMP_DIR)
+    total = 0
+    async for chunk in request.stream():
+        total += len(chunk)
+        if total > MAX_BODY_BYTES:
+            buf.close()
+            return ORJSONResponse({"error": "Audio payload too large"}, status_code=413)
+        buf.write(chunk)
+    if not total:
+        buf.close()
+        return ORJSONResponse({"error": "Empty request body"}, status_code=400)
+    buf.seek(0)
+
+    async def gen():
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        job = None
+        try:
+            async with transcribe_semaphore:
+                # Same threadpool as /transcribe; the worker closes buf when done
+                job = asyncio.ensure_future(run_in_threadpool(_stream_segments, buf, loop, queue, stop))
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        break
+                    yield orjson.dumps(item) + b"\n"
+                await job
+        finally:
+            # client went away: let the worker stop at the next segment
+            stop.set()
+            if job is None:
+                buf.close()
+
+    return StreamingResponse(gen(), media_type="application/x-ndjson")
@@ -1,19 +1,32 @@
 from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
-from fastapi.responses import Response, JSONResponse
+from fastapi.responses import Response, JSONResponse, StreamingResponse
 from TTS.api import TTS
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import uvicorn
-import io
+import asyncio
+import functools
+import hashlib
 import logging
+import math
 import os
+import struct
 import sys
+import threading
 import numpy as np
-import soundfile as sf
+import torch
 import inspect
 
+try:
+    from scipy.signal import firwin, resample, resample_poly
+    _HAS_SCIPY = True
+except ImportError:
+    _HAS_SCIPY = False
+
 # Logging: level from env (default INFO), to stderr with timestamp
 LOG_LEVEL = getattr(logging, os.getenv("XTTS_LOG_LEVEL", "INFO").upper(), logging.INFO)
 logging.basicConfig(
@@ -57,11 +70,155 @@ VOICES_DIR = os.getenv("XTTS_VOICES_DIR", os.path.join(_BASE_DIR, "xtts_voices")
 MODEL_SAMPLE_RATE = 24000
 OUTPUT_SAMPLE_RATE = int(os.getenv("XTTS_OUTPUT_SAMPLE_RATE", "24000"))
 
+# Concurrent syntheses per process (see tts_pool below).
+# Default 1: concurrent XTTS inferences mostly just contend for the same GPU/CPU.
+XTTS_MAX_CONCURRENT = int(os.getenv("XTTS_MAX_CONCURRENT", "1"))
+
+# Split the cores between server processes (gunicorn's WEB_CONCURRENCY) and the
+# concurrent syntheses inside each, so CPU-mode XTTS doesn't oversubscribe; one
+# inter-op thread since requests already run in parallel via tts_pool.
+_WORKERS = int(os.getenv("WEB_CONCURRENCY") or "1")
+XTTS_TORCH_THREADS = int(
+    os.getenv(
+        "XTTS_TORCH_THREADS",
+        str(max(1, (os.cpu_count() or 1) // max(1, _WORKERS * XTTS_MAX_CONCURRENT))),
+    )
+)
+torch.set_num_threads(XTTS_TORCH_THREADS)
+try:
+    torch.set_num_interop_threads(1)
+except RuntimeError:
+    # Only allowed before any inter-op work has started in this process
+    logger.debug("torch inter-op threads already initialized; leaving as is")
+
 tts = TTS(MODEL_NAME, gpu=USE_GPU)
 
+# Inference only: no autograd bookkeeping on any parameter.
+for _p in tts.synthesizer.tts_model.parameters():
+    _p.requires_grad_(False)
+
+# XTTS_DTYPE=float16|bfloat16 runs the GPT stage on GPU under autocast (it is
+# memory-bound, so half-width weights/activations roughly double token rate).
+# Only the GPT forwards are wrapped (see below); the speaker encoder and HiFi-GAN
+# decoder stay float32, which also keeps the returned wav numpy-convertible.
+XTTS_DTYPE = os.getenv("XTTS_DTYPE", "float32").lower()
+_AUTOCAST_DTYPE = {"float16": torch.float16, "bfloat16": torch.bfloat16}.get(XTTS_DTYPE) if USE_GPU else None
+if USE_GPU:
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+
+
+# Opt-in torch.compile of the per-token GPT forward and the HiFi-GAN decoder: at
+# batch 1 the AR decode is dominated by kernel-launch/dispatch overhead, which
+# CUDA graphs ("reduce-overhead") remove. Graphs are captured on the startup
+# warmup; anything dynamo can't handle runs eagerly instead of failing.
+XTTS_COMPILE = os.getenv("XTTS_COMPILE", "false").lower() in ("1", "true", "yes")
+XTTS_COMPILE_MODE = os.getenv("XTTS_COMPILE_MODE", "reduce-overhead")
+if XTTS_COMPILE:
+    import torch._dynamo
+
+    torch._dynamo.config.suppress_errors = True
+    _model = tts.synthesizer.tts_model
+    # Patch the instance's forward (not the module) so HF generate(), which
+    # calls self(...) on the original module, goes through the compiled graph.
+    for _name, _module in (
+        ("gpt_inference", getattr(getattr(_model, "gpt", None), "gpt_inference", None)),
+        ("hifigan_decoder", getattr(_model, "hifigan_decoder", None)),
+    ):
+        if _module is None:
+            continue
+        try:
+            _module.forward = torch.compile(_module.forward, mode=XTTS_COMPILE_MODE, dynamic=True)
+            logger.info("torch.compile(%s, mode=%s) enabled", _name, XTTS_COMPILE_MODE)
+        except Exception:
+            logger.exception("torch.compile(%s) failed; staying eager", _name)
+
+
+def _autocast_forward(forward):
+    @functools.wraps(forward)
+    def wrapped(*args, **kwargs):
+        with torch.autocast("cuda", dtype=_AUTOCAST_DTYPE):
+            return forward(*args, **kwargs)
+
+    return wrapped
+
+
+def _float32_latents_forward(forward):
+    @functools.wraps(forward)
+    def wrapped(latents, *args, **kwargs):
+        return forward(latents.float(), *args, **kwargs)
+
+    return wrapped
+
+
+if _AUTOCAST_DTYPE is not None:
+    _model = tts.synthesizer.tts_model
+    _gpt = getattr(_model, "gpt", None)
+    # gpt_inference is the per-token decode behind generate()/generate_stream();
+    # gpt.forward is the latent pass inference() feeds to the decoder; final_norm
+    # is applied to the streamed hidden states outside any forward. All are
+    # instance-patched so they also wrap any compiled forward above.
+    _gpt_inference = getattr(_gpt, "gpt_inference", None)
+    for _module in (_gpt_inference, getattr(_gpt_inference, "final_norm", None), _gpt):
+        if _module is not None:
+            _module.forward = _autocast_forward(_module.forward)
+    # GPT latents come out half-width; HiFi-GAN runs outside autocast on float32 weights.
+    _decoder = getattr(_model, "hifigan_decoder", None)
+    if _decoder is not None:
+        _decoder.forward = _float32_latents_forward(_decoder.forward)
+    logger.info("GPT autocast dtype=%s", XTTS_DTYPE)
+
+# Warmup texts for graph capture, roughly short / medium / long replies
+_COMPILE_WARMUP_TEXTS = (
+    "Thanks for calling, how can I help?",
+    "Sure, I can help with that. Let me check the schedule for you, one moment please.",
+    "I have an opening on Tuesday at ten in the morning or Thursday at two in the afternoon. "
+    "Would either of those work for you, or would you prefer a different day next week?",
+)
+
+
+# tts.tts() blocks for the whole synthesis; run it (and the WAV encode) on a
+# dedicated pool so the event loop keeps serving health checks and other I/O.
+tts_semaphore = asyncio.Semaphore(XTTS_MAX_CONCURRENT)
+tts_pool = ThreadPoolExecutor(max_workers=XTTS_MAX_CONCURRENT, thread_name_prefix="xtts")
+
+# Receptionist prompts ("Thanks for calling ...") repeat constantly; keep recent
+# /tts WAVs in an LRU keyed by everything that affects the audio. Only touched
+# from the event loop, so no lock is needed. Bounded by entry count and total
+# bytes (24 kHz PCM16 is ~48 KB/s, per worker process); clips over an eighth of
+# the byte budget are long one-offs and are not cached at all.
+XTTS_CACHE_MAX = int(os.getenv("XTTS_CACHE_MAX", "64"))
+XTTS_CACHE_MAX_BYTES = int(os.getenv("XTTS_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+_wav_cache: "OrderedDict[bytes, bytes]" = OrderedDict()
+_wav_cache_bytes = 0
+
+
+def _cache_wav(key: bytes, audio: bytes) -> None:
+    global _wav_cache_bytes
+    if XTTS_CACHE_MAX <= 0 or len(audio) > XTTS_CACHE_MAX_BYTES // 8 or key in _wav_cache:
+        return
+    _wav_cache[key] = audio
+    _wav_cache_bytes += len(audio)
+    while len(_wav_cache) > XTTS_CACHE_MAX or _wav_cache_bytes > XTTS_CACHE_MAX_BYTES:
+        _wav_cache_bytes -= len(_wav_cache.popitem(last=False)[1])
+
 # Introspect what this specific install/model supports
 _TTS_SIG = inspect.signature(tts.tts)
-_TTS_PARAMS = set(_TTS_SIG.parameters.keys())
+_TTS_PARAMS = frozenset(_TTS_SIG.parameters.keys())
+_HAS_TEXT_KW = "text" in _TTS_PARAMS
+
+# XTTS models expose the speaker encoder and the decoder separately. tts.tts()
+# re-encodes speaker_wav on every call; with these we encode each voice once.
+_XTTS_MODEL = getattr(getattr(tts, "synthesizer", None), "tts_model", None)
+_HAS_COND_API = hasattr(_XTTS_MODEL, "get_conditioning_latents") and hasattr(_XTTS_MODEL, "inference")
+_HAS_STREAM_API = _HAS_COND_API and hasattr(_XTTS_MODEL, "inference_stream")
+_SAMPLER_FIELDS = ("temperature", "length_penalty", "repetition_penalty", "top_k", "top_p")
+# kwargs the cached-latent path reproduces exactly; anything else goes through tts.tts().
+# speed is accepted but, as in TTS.api for local models, not forwarded.
+_COND_PATH_KWARGS = {"speaker_wav", "language", "split_sentences", "speed", *_SAMPLER_FIELDS}
+# Synthesizer.tts() pads each sentence with this many zero samples.
+_SENTENCE_GAP = np.zeros(10000, dtype=np.float32)
+XTTS_COND_CACHE_MAX = int(os.getenv("XTTS_COND_CACHE_MAX", "32"))
 
 # Optional COQUI_* env defaults (used when request omits a tuning)
 def _coqui_env_float(key: str, default: str | None = None) -> float | None:
@@ -80,16 +237,32 @@ def _coqui_env_bool(key: str, default: str | None = None) -> bool | None:
     return v.lower() in ("1", "true", "yes")
 
 
+def _voices_dir_mtime() -> int | None:
+    try:
+        return os.stat(VOICES_DIR).st_mtime_ns
+    except OSError:
+        return None
+
+
+@functools.lru_cache(maxsize=1)
+def _voice_files(dir_mtime_ns: int) -> tuple[str, ...]:
+    """Sorted .wav file names in VOICES_DIR. Keyed on the dir mtime, which changes
+    whenever an entry is added, removed or renamed, so the snapshot never goes stale."""
+    with os.scandir(VOICES_DIR) as it:
+        return tuple(sorted(e.name for e in it if e.name.lower().endswith(".wav") and e.is_file()))
+
+
 def _log_voices_dir_state() -> None:
     """Log VOICES_DIR path, existence, and list of .wav files (for debugging 400/500)."""
-    exists = os.path.isdir(VOICES_DIR)
+    dir_mtime_ns = _voices_dir_mtime()
+    exists = dir_mtime_ns is not None
     logger.info("voices_dir=%s exists=%s", VOICES_DIR, exists)
     if exists:
         try:
-            wavs = sorted(f for f in os.listdir(VOICES_DIR) if f.lower().endswith(".wav"))
+            wavs = list(_voice_files(dir_mtime_ns))
             logger.info("voices_dir contains %d wav(s): %s", len(wavs), wavs if len(wavs) <= 20 else wavs[:20] + ["..."])
         except OSError as e:
-            logger.warning("voices_dir listdir failed: %s", e)
+            logger.warning("voices_dir scandir failed: %s", e)
     else:
         logger.warning("voices_dir missing; run: python download_xtts_voices.py")
 
@@ -130,11 +303,12 @@ class TTSRequest(BaseModel):
     length_penalty: float | None = None
 
 
-def _first_wav_in_voices_dir() -> str | None:
+def _first_wav_in_voices_dir(dir_mtime_ns: int) -> str | None:
     """Return path to first .wav in VOICES_DIR (sorted), or None."""
-    if not os.path.isdir(VOICES_DIR):
+    try:
+        wavs = _voice_files(dir_mtime_ns)
+    except OSError:
         return None
-    wavs = sorted(f for f in os.listdir(VOICES_DIR) if f.lower().endswith(".wav"))
     if not wavs:
         return None
     return os.path.join(VOICES_DIR, wavs[0])
@@ -155,7 +329,17 @@ def resolve_speaker_wav(req: TTSRequest) -> str | None:
     if req.speaker_wav:
         logger.debug("resolve_speaker_wav: request speaker_wav=%s not a file, skipping", req.speaker_wav)
 
-    voice_id = req.voice_id or req.speaker
+    # One stat per request; the voices dir mtime changes whenever a wav is
+    # added, removed or renamed, which invalidates the memoized lookup.
+    return _resolve_voice(req.voice_id or req.speaker, _voices_dir_mtime())
+
+
+@functools.lru_cache(maxsize=256)
+def _resolve_voice(voice_id: str | None, dir_mtime_ns: int | None) -> str | None:
+    if dir_mtime_ns is None:
+        logger.debug("resolve_speaker_wav: voices_dir %s missing, returning None", VOICES_DIR)
+        return None
+
     if voice_id:
         candidate = os.path.join(VOICES_DIR, f"{voice_id}.wav")
         if os.path.exists(candidate):
@@ -169,7 +353,7 @@ def resolve_speaker_wav(req: TTSRequest) -> str | None:
         return fallback
     logger.debug("resolve_speaker_wav: default_voice.wav not found at %s", fallback)
 
-    first = _first_wav_in_voices_dir()
+    first = _first_wav_in_voices_dir(dir_mtime_ns)
     if first:
         logger.debug("resolve_speaker_wav: using first wav in dir: %s", first)
         return first
@@ -177,6 +361,42 @@ def resolve_speaker_wav(req: TTSRequest) -> str | None:
     return None
 
 
+# Optional fields: forward if in tts() signature (e.g. speed, language, split_sentences)
+_CANDIDATE_FIELDS = (
+    "language",
+    "emotion",
+    "style",
+    "style_wav",
+    "speed",
+    "split_sentences",
+    "temperature",
+    "top_p",
+    "top_k",
+    "repetition_penalty",
+    "length_penalty",
+)
+_PASSTHROUGH_KWARGS = {"temperature", "top_p", "top_k", "repetition_penalty", "length_penalty"}
+# Fields that reach tts.tts(): in its signature, or via **kwargs to XTTS synthesize()
+_FORWARDED_FIELDS = tuple(
+    f for f in _CANDIDATE_FIELDS if f in _TTS_PARAMS or f in _PASSTHROUGH_KWARGS
+)
+
+# COQUI_* env defaults when request omits a tuning (read once at import)
+_COQUI_DEFAULTS = {
+    "temperature": _coqui_env_float("COQUI_TEMPERATURE"),
+    "length_penalty": _coqui_env_float("COQUI_LENGTH_PENALTY"),
+    "repetition_penalty": _coqui_env_float("COQUI_REPETITION_PENALTY"),
+    "top_p": _coqui_env_float("COQUI_TOP_P"),
+    "speed": _coqui_env_float("COQUI_SPEED"),
+    "split_sentences": _coqui_env_bool("COQUI_SPLIT_SENTENCES"),
+}
+_top_k_default = _coqui_env_float("COQUI_TOP_K")
+if _top_k_default is not None:
+    _COQUI_DEFAULTS["top_k"] = int(_top_k_default)
+# (field, env default) pairs resolved once, so a request only does getattr per field
+_FORWARDED_DEFAULTS = tuple((f, _COQUI_DEFAULTS.get(f)) for f in _FORWARDED_FIELDS)
+
+
 def build_tts_kwargs(req: TTSRequest) -> dict:
     """
     Build kwargs for tts.tts(), only including parameters
@@ -189,80 +409,299 @@ def build_tts_kwargs(req: TTSRequest) -> dict:
     if speaker_wav is not None and "speaker_wav" in _TTS_PARAMS:
         kwargs["speaker_wav"] = speaker_wav
 
-    # Optional fields: forward if in tts() signature (e.g. speed, language, split_sentences)
-    candidate_fields = [
-        "language",
-        "emotion",
-        "style",
-        "style_wav",
-        "speed",
-        "split_sentences",
-        "temperature",
-        "top_p",
-        "top_k",
-        "repetition_penalty",
-        "length_penalty",
-    ]
-    # COQUI_* env defaults when request omits a tuning
-    _coqui_defaults = {
-        "temperature": _coqui_env_float("COQUI_TEMPERATURE"),
-        "length_penalty": _coqui_env_float("COQUI_LENGTH_PENALTY"),
-        "repetition_penalty": _coqui_env_float("COQUI_REPETITION_PENALTY"),
-        "top_p": _coqui_env_float("COQUI_TOP_P"),
-        "speed": _coqui_env_float("COQUI_SPEED"),
-        "split_sentences": _coqui_env_bool("COQUI_SPLIT_SENTENCES"),
-    }
-    top_k_val = _coqui_env_float("COQUI_TOP_K")
-    if top_k_val is not None:
-        _coqui_defaults["top_k"] = int(top_k_val)
-
-    passthrough_kwargs = {"temperature", "top_p", "top_k", "repetition_penalty", "length_penalty"}
-
-    for field in candidate_fields:
+    for field, default in _FORWARDED_DEFAULTS:
         value = getattr(req, field)
-        if value is None and field in _coqui_defaults:
-            value = _coqui_defaults[field]
         if value is None:
-            continue
-        if field in _TTS_PARAMS:
+            value = default
+        if value is not None:
             kwargs[field] = value
-        elif field in passthrough_kwargs:
-            kwargs[field] = value  # reach XTTS synthesize() via **kwargs
 
     return kwargs
 
 
+# Polyphase ratios up to this size (24k->16k is 2/3, 24k->8k is 1/3) use
+# resample_poly; anything more awkward falls back to FFT resampling.
+_MAX_POLY_FACTOR = 1000
+
+
+@functools.lru_cache(maxsize=16)
+def _poly_filter(up: int, down: int) -> np.ndarray:
+    # Same anti-aliasing FIR resample_poly designs by default, built once per ratio.
+    # float32 taps keep the filtering itself in float32 for float32 audio.
+    max_rate = max(up, down)
+    return firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=("kaiser", 5.0)).astype(np.float32)
+
+
 def _resample(wav: np.ndarray, orig_sr: int, target_sr: int) -> np.ndarray:
-    """Resample 1D float array from orig_sr to target_sr. Prefer FFT resampling when
-    downsampling to avoid aliasing (linear interpolation can sound muffled / like <16 kHz).
+    """Resample 1D float array from orig_sr to target_sr. Prefer polyphase FIR resampling
+    to avoid aliasing (linear interpolation can sound muffled / like <16 kHz).
     """
     if orig_sr == target_sr:
         return wav
     n = int(len(wav) * target_sr / orig_sr)
     if n <= 0:
         return wav
-    # Downsampling: use FFT-based resample if available to avoid aliasing
+    if _HAS_SCIPY:
+        g = math.gcd(orig_sr, target_sr)
+        up, down = target_sr // g, orig_sr // g
+        if max(up, down) <= _MAX_POLY_FACTOR:
+            return resample_poly(wav, up, down, window=_poly_filter(up, down)).astype(np.float32, copy=False)
+        return resample(wav, n).astype(np.float32)
     if target_sr < orig_sr:
-        try:
-            from scipy.signal import resample
-            out = resample(wav, n).astype(np.float32)
-            return out
-        except ImportError:
-            logger.debug("scipy not available; downsampling with linear interp (may sound muffled)")
+        logger.debug("scipy not available; downsampling with linear interp (may sound muffled)")
     # Linear interpolation (fine for upsampling)
     old_x = np.arange(len(wav), dtype=np.float64)
     new_x = np.linspace(0, len(wav) - 1, num=n, dtype=np.float64)
     return np.interp(new_x, old_x, wav).astype(np.float32)
 
 
+@functools.lru_cache(maxsize=XTTS_COND_CACHE_MAX)
+def _conditioning(path: str, mtime_ns: int):
+    # mtime_ns is only part of the key, so a replaced voice file is re-encoded.
+    # Xtts.synthesize() (the tts.tts() path) takes these from the model config,
+    # not from full_inference()'s defaults; use the same values so the latents match.
+    config = tts.synthesizer.tts_config
+    return _XTTS_MODEL.get_conditioning_latents(
+        audio_path=path,
+        gpt_cond_len=config.gpt_cond_len,
+        gpt_cond_chunk_len=config.gpt_cond_chunk_len,
+        max_ref_length=config.max_ref_len,
+        sound_norm_refs=config.sound_norm_refs,
+    )
+
+
+def _warm_conditioning() -> None:
+    dir_mtime_ns = _voices_dir_mtime()
+    if not _HAS_COND_API or dir_mtime_ns is None:
+        return
+    for f in _voice_files(dir_mtime_ns):
+        path = os.path.join(VOICES_DIR, f)
+        try:
+            _conditioning(path, os.stat(path).st_mtime_ns)
+        except Exception:
+            logger.exception("conditioning latents failed for %s", path)
+    logger.info("conditioning latents cached: %s", _conditioning.cache_info())
+
+
+def _warm_compiled() -> None:
+    speaker_wav = _resolve_voice(None, _voices_dir_mtime())
+    if speaker_wav is None:
+        return
+    tts_kwargs = {"speaker_wav": speaker_wav, "language": "en"}
+    for text in _COMPILE_WARMUP_TEXTS:
+        try:
+            _synthesize_wav(text, tts_kwargs, MODEL_SAMPLE_RATE)
+        except Exception:
+            logger.exception("compile warmup failed for text_len=%d", len(text))
+    logger.info("torch.compile warmup done")
+
+
+def _uses_cached_conditioning(tts_kwargs: dict) -> bool:
+    return _HAS_COND_API and "speaker_wav" in tts_kwargs and tts_kwargs.keys() <= _COND_PATH_KWARGS
+
+
+def _cond_inputs(text: str, tts_kwargs: dict):
+    """Latents, sentences and sampler settings as Synthesizer.tts/Xtts.synthesize derive them."""
+    path = tts_kwargs["speaker_wav"]
+    gpt_cond_latent, speaker_embedding = _conditioning(path, os.stat(path).st_mtime_ns)
+
+    config = tts.synthesizer.tts_config
+    settings = {field: getattr(config, field) for field in _SAMPLER_FIELDS}
+    settings.update((field, tts_kwargs[field]) for field in _SAMPLER_FIELDS if field in tts_kwargs)
+
+    if tts_kwargs.get("split_sentences", True):
+        sentences = tts.synthesizer.split_into_sentences(text)
+    else:
+        sentences = [text]
+    return gpt_cond_latent, speaker_embedding, sentences, settings
+
+
+def _synthesize_with_cached_conditioning(text: str, tts_kwargs: dict) -> np.ndarray:
+    """Same output as tts.tts() for XTTS, minus the per-call speaker encoding."""
+    gpt_cond_latent, speaker_embedding, sentences, settings = _cond_inputs(text, tts_kwargs)
+    language = tts_kwargs.get("language")
+
+    chunks = []
+    for sentence in sentences:
+        out = _XTTS_MODEL.inference(sentence, language, gpt_cond_latent, speaker_embedding, **settings)
+        chunks.append(np.asarray(out["wav"], dtype=np.float32).reshape(-1))
+        chunks.append(_SENTENCE_GAP)
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+
+
+def _synthesize_audio(text: str, tts_kwargs: dict) -> np.ndarray:
+    """Full utterance as 1D float32 at MODEL_SAMPLE_RATE."""
+    if _uses_cached_conditioning(tts_kwargs):
+        wav = _synthesize_with_cached_conditioning(text, tts_kwargs)
+    elif _HAS_TEXT_KW:
+        wav = tts.tts(text=text, **tts_kwargs)
+    else:
+        wav = tts.tts(text, **tts_kwargs)
+    # Ensure numpy 1D float; XTTS returns 24 kHz
+    return np.asarray(wav, dtype=np.float32).flatten()
+
+
+_WAV_UNKNOWN_SIZE = 0xFFFFFFFF  # streaming: length not known when the header is sent
+
+
+def _riff_header(data_bytes: int, sample_rate: int, channels: int = 1, bits: int = 16) -> bytes:
+    """44-byte canonical PCM WAV header."""
+    block_align = channels * bits // 8
+    riff_size = _WAV_UNKNOWN_SIZE if data_bytes == _WAV_UNKNOWN_SIZE else 36 + data_bytes
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", riff_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, bits,
+        b"data", data_bytes,
+    )
+
+
+def _to_pcm16(samples: np.ndarray) -> bytes:
+    # One float32 scratch buffer for clip+scale, then a single cast into int16.
+    scaled = np.clip(samples, -1.0, 1.0, dtype=np.float32)
+    scaled *= 32767.0
+    return scaled.astype("<i2").tobytes()
+
+
+def _synthesize_wav(text: str, tts_kwargs: dict, out_sr: int) -> bytes:
+    with torch.inference_mode():
+        wav = _synthesize_audio(text, tts_kwargs)
+    if out_sr != MODEL_SAMPLE_RATE:
+        wav = _resample(wav, MODEL_SAMPLE_RATE, out_sr)
+        logger.debug("POST /tts resampled %s -> %s Hz", MODEL_SAMPLE_RATE, out_sr)
+    # mono PCM16 WAV, built directly instead of going through libsndfile
+    pcm = _to_pcm16(wav)
+    return _riff_header(len(pcm), out_sr) + pcm
+
+
+# ---- Streaming (/tts_stream) ----
+
+# GPT tokens per inference_stream chunk; smaller means earlier first audio
+XTTS_STREAM_CHUNK_SIZE = int(os.getenv("XTTS_STREAM_CHUNK_SIZE", "20"))
+
+
+class _StreamResampler:
+    """Chunk-by-chunk resample_poly whose concatenated output equals one-shot
+    _resample over the whole signal, so there are no clicks at chunk seams.
+
+    Each output sample is only emitted once all input within the FIR's reach
+    has arrived; the input tail it still needs is carried over, trimmed to a
+    multiple of `down` so the polyphase grid stays aligned.
+    """
+
+    def __init__(self, orig_sr: int, target_sr: int):
+        g = math.gcd(orig_sr, target_sr)
+        self.up, self.down = target_sr // g, orig_sr // g
+        self.h = _poly_filter(self.up, self.down)
+        self.reach = -(-(len(self.h) // 2) // self.up) + 1  # FIR half-width in input samples
+        self.buf = np.zeros(0, dtype=np.float32)
+        self.start = 0  # absolute input index of buf[0]
+        self.total = 0  # input samples received
+        self.emitted = 0  # output samples returned
+
+    def push(self, chunk: np.ndarray) -> np.ndarray:
+        self.buf = np.concatenate((self.buf, chunk))
+        self.total += len(chunk)
+        ready = max(0, (self.total - 1 - self.reach) * self.up // self.down + 1)
+        return self._emit(ready)
+
+    def flush(self) -> np.ndarray:
+        return self._emit(-(-self.total * self.up // self.down))
+
+    def _emit(self, end: int) -> np.ndarray:
+        if end <= self.emitted or not len(self.buf):
+            return np.zeros(0, dtype=np.float32)
+        y = resample_poly(self.buf, self.up, self.down, window=self.h)
+        first = self.start * self.up // self.down
+        out = y[self.emitted - first:end - first].copy()
+        self.emitted = end
+        keep_from = max(0, self.emitted * self.down // self.up - self.reach)
+        keep_from -= keep_from % self.down
+        if keep_from > self.start:
+            self.buf = self.buf[keep_from - self.start:]
+            self.start = keep_from
+        return out
+
+
+def _iter_audio(text: str, tts_kwargs: dict):
+    """Yield float32 chunks at MODEL_SAMPLE_RATE as XTTS produces them."""
+    if not (_HAS_STREAM_API and _uses_cached_conditioning(tts_kwargs)):
+        # No streaming API for this model/request: one chunk with the whole utterance
+        yield _synthesize_audio(text, tts_kwargs)
+        return
+    gpt_cond_latent, speaker_embedding, sentences, settings = _cond_inputs(text, tts_kwargs)
+    language = tts_kwargs.get("language")
+    for sentence in sentences:
+        for chunk in _XTTS_MODEL.inference_stream(
+            sentence,
+            language,
+            gpt_cond_latent,
+            speaker_embedding,
+            stream_chunk_size=XTTS_STREAM_CHUNK_SIZE,
+            **settings,
+        ):
+            yield chunk.float().cpu().numpy().reshape(-1)
+        yield _SENTENCE_GAP
+
+
+def _stream_pcm(
+    text: str,
+    tts_kwargs: dict,
+    out_sr: int,
+    loop: asyncio.AbstractEventLoop,
+    queue: asyncio.Queue,
+    stop: threading.Event,
+) -> None:
+    # Runs on tts_pool; hands PCM16 to the event loop as soon as each chunk is decoded
+    try:
+        resampler = None
+        if out_sr != MODEL_SAMPLE_RATE and _HAS_SCIPY:
+            resampler = _StreamResampler(MODEL_SAMPLE_RATE, out_sr)
+            if max(resampler.up, resampler.down) > _MAX_POLY_FACTOR:
+                resampler = None
+        with torch.inference_mode():
+            for chunk in _iter_audio(text, tts_kwargs):
+                if stop.is_set():
+                    return
+                if resampler is not None:
+                    chunk = resampler.push(chunk)
+                elif out_sr != MODEL_SAMPLE_RATE:
+                    chunk = _resample(chunk, MODEL_SAMPLE_RATE, out_sr)
+                if len(chunk):
+                    loop.call_soon_threadsafe(queue.put_nowait, _to_pcm16(chunk))
+        if resampler is not None:
+            loop.call_soon_threadsafe(queue.put_nowait, _to_pcm16(resampler.flush()))
+    except Exception:
+        logger.exception("POST /tts_stream: TTS synthesis failed mid-stream")
+    finally:
+        loop.call_soon_threadsafe(queue.put_nowait, None)
+
+
 # Log env and voices dir once at import (so startup logs show state before first request)
 logger.info(
-    "model=%s gpu=%s voices_dir=%s model_sr=%s output_sr=%s tts_params=%s",
-    MODEL_NAME, USE_GPU, VOICES_DIR, MODEL_SAMPLE_RATE, OUTPUT_SAMPLE_RATE, sorted(_TTS_PARAMS),
+    "model=%s gpu=%s voices_dir=%s model_sr=%s output_sr=%s torch_threads=%s tts_params=%s",
+    MODEL_NAME, USE_GPU, VOICES_DIR, MODEL_SAMPLE_RATE, OUTPUT_SAMPLE_RATE, XTTS_TORCH_THREADS,
+    sorted(_TTS_PARAMS),
 )
 _log_voices_dir_state()
 
 
+@app.on_event("startup")
+async def warm_conditioning():
+    # Encode every shipped voice on the synthesis pool, without holding up
+    # startup; any voice not cached yet is encoded on its first request.
+    loop = asyncio.get_running_loop()
+    # Resolve the default voice up front so requests without voice_id hit the
+    # memo, and a missing voices dir shows up in the startup log.
+    default_speaker_wav = _resolve_voice(None, _voices_dir_mtime())
+    logger.info("default speaker_wav=%s", default_speaker_wav)
+    if default_speaker_wav is None:
+        _log_voices_dir_state()
+    loop.run_in_executor(tts_pool, _warm_conditioning)
+    if XTTS_COMPILE:
+        loop.run_in_executor(tts_pool, _warm_compiled)
+
+
 @app.get("/health")
 def health():
     return {
@@ -272,47 +711,57 @@ def health():
         "voices_dir": VOICES_DIR,
         "model_sample_rate": MODEL_SAMPLE_RATE,
         "output_sample_rate": OUTPUT_SAMPLE_RATE,
-        "tts_supported_params": sorted(list(_TTS_PARAMS)),
+        "tts_supported_params": sorted(_TTS_PARAMS),
     }
 
 
 @app.get("/voices")
 def voices():
-    if not os.path.isdir(VOICES_DIR):
+    dir_mtime_ns = _voices_dir_mtime()
+    if dir_mtime_ns is None:
         return {"voices": []}
-    items = []
-    for f in os.listdir(VOICES_DIR):
-        if f.lower().endswith(".wav"):
-            items.append(os.path.splitext(f)[0])
-    items.sort()
-    return {"voices": items}
+    return {"voices": sorted(os.path.splitext(f)[0] for f in _voice_files(dir_mtime_ns))}
 
 
-@app.post("/tts")
-@limiter.limit(f"{RATE_LIMIT}/minute")
-async def synthesize(request: Request, req: TTSRequest):
+def _cache_key(text: str, tts_kwargs: dict, out_sr: int) -> bytes:
+    # The voice file's mtime is part of the key so re-recorded voices miss
+    speaker_wav = tts_kwargs.get("speaker_wav")
+    try:
+        mtime_ns = os.stat(speaker_wav).st_mtime_ns if speaker_wav else 0
+    except OSError:
+        mtime_ns = 0
+    params = "|".join(f"{k}={tts_kwargs[k]}" for k in sorted(tts_kwargs))
+    return hashlib.blake2b(
+        f"{out_sr}|{mtime_ns}|{params}|{text}".encode("utf-8"), digest_size=16
+    ).digest()
+
+
+def _prepare_request(req: TTSRequest, route: str) -> tuple[str, dict, int]:
+    """Validate a /tts or /tts_stream body; returns (text, tts_kwargs, out_sr)."""
     text = (req.text or "").strip()
     logger.info(
-        "POST /tts request: text_len=%d language=%s voice_id=%s speaker=%s speaker_wav=%s",
+        "POST %s request: text_len=%d language=%s voice_id=%s speaker=%s speaker_wav=%s",
+        route,
         len(text),
-        getattr(req, "language", None),
-        getattr(req, "voice_id", None),
-        getattr(req, "speaker", None),
-        ("<path>" if (getattr(req, "speaker_wav", None)) else None),
+        req.language,
+        req.voice_id,
+        req.speaker,
+        "<path>" if req.speaker_wav else None,
     )
     if not text:
-        logger.warning("POST /tts 400: text_required")
+        logger.warning("POST %s 400: text_required", route)
         raise HTTPException(status_code=400, detail="text_required")
 
     tts_kwargs = build_tts_kwargs(req)
     resolved_speaker = tts_kwargs.get("speaker_wav")
-    logger.info("POST /tts resolved speaker_wav=%s tts_kwargs=%s", resolved_speaker, tts_kwargs)
+    logger.info("POST %s resolved speaker_wav=%s tts_kwargs=%s", route, resolved_speaker, tts_kwargs)
 
     # XTTS requires speaker_wav (path to WAV). Without it we get RuntimeError: AudioDecoder for None.
     if "speaker_wav" in _TTS_PARAMS and resolved_speaker is None:
         _log_voices_dir_state()
         logger.warning(
-            "POST /tts 400: speaker required (no voice_id/speaker/speaker_wav and no wav in voices_dir)"
+            "POST %s 400: speaker required (no voice_id/speaker/speaker_wav and no wav in voices_dir)",
+            route,
         )
         raise HTTPException(
             status_code=400,
@@ -322,28 +771,71 @@ async def synthesize(request: Request, req: TTSRequest):
             ),
         )
 
+    out_sr = req.output_sample_rate if req.output_sample_rate is not None else OUTPUT_SAMPLE_RATE
+    return text, tts_kwargs, out_sr
+
+
+@app.post("/tts")
+@limiter.limit(f"{RATE_LIMIT}/minute")
+async def synthesize(request: Request, req: TTSRequest):
+    text, tts_kwargs, out_sr = _prepare_request(req, "/tts")
+    resolved_speaker = tts_kwargs.get("speaker_wav")
+    key = _cache_key(text, tts_kwargs, out_sr)
+    cached = _wav_cache.get(key)
+    if cached is not None:
+        _wav_cache.move_to_end(key)
+        logger.info("POST /tts 200 (cached): speaker_wav=%s response_bytes=%d", resolved_speaker, len(cached))
+        return Response(content=cached, media_type="audio/wav")
+
     try:
-        if "text" in _TTS_PARAMS:
-            wav = tts.tts(text=text, **tts_kwargs)
-        else:
-            wav = tts.tts(text, **tts_kwargs)
+        async with tts_semaphore:
+            loop = asyncio.get_running_loop()
+            audio = await loop.run_in_executor(tts_pool, _synthesize_wav, text, tts_kwargs, out_sr)
     except Exception as e:
         logger.exception("POST /tts 500: TTS synthesis failed: %s", e)
         return JSONResponse(status_code=500, content={"error": str(e)})
 
-    # Ensure numpy 1D float; XTTS returns 24 kHz
-    wav = np.asarray(wav, dtype=np.float32).flatten()
-    out_sr = req.output_sample_rate if req.output_sample_rate is not None else OUTPUT_SAMPLE_RATE
-    if out_sr != MODEL_SAMPLE_RATE:
-        wav = _resample(wav, MODEL_SAMPLE_RATE, out_sr)
-        logger.debug("POST /tts resampled %s -> %s Hz", MODEL_SAMPLE_RATE, out_sr)
-    buf = io.BytesIO()
-    sf.write(buf, wav, out_sr, format="WAV")
-    size = buf.getvalue()
-    logger.info("POST /tts 200: speaker_wav=%s response_bytes=%d", resolved_speaker, len(size))
-    return Response(content=size, media_type="audio/wav")
+    _cache_wav(key, audio)
+    logger.info("POST /tts 200: speaker_wav=%s response_bytes=%d", resolved_speaker, len(audio))
+    return Response(content=audio, media_type="audio/wav")
+
+
+# Same request body as /tts; streams PCM16 as XTTS decodes it so playback can start
+# after the first chunk. The header carries 0xFFFFFFFF sizes, so clients must read
+# until EOF. Errors after the header can only end the stream early.
+@app.post("/tts_stream")
+@limiter.limit(f"{RATE_LIMIT}/minute")
+async def synthesize_stream(request: Request, req: TTSRequest):
+    text, tts_kwargs, out_sr = _prepare_request(req, "/tts_stream")
+    cached = _wav_cache.get(_cache_key(text, tts_kwargs, out_sr))
+    if cached is not None:
+        # Already rendered by /tts: the complete WAV is as fast as any stream
+        return Response(content=cached, media_type="audio/wav")
+
+    async def gen():
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        try:
+            async with tts_semaphore:
+                job = loop.run_in_executor(
+                    tts_pool, _stream_pcm, text, tts_kwargs, out_sr, loop, queue, stop
+                )
+                yield _riff_header(_WAV_UNKNOWN_SIZE, out_sr)
+                while True:
+                    pcm = await queue.get()
+                    if pcm is None:
+                        break
+                    yield pcm
+                await job
+        finally:
+            # client went away: let the worker stop at the next chunk
+            stop.set()
+
+    return StreamingResponse(gen(), media_type="audio/wav")
 
 
 if __name__ == "__main__":
     # Use 7001 so it plugs into your existing XTTS_URL default
+    # Single process; for several workers run under gunicorn with WEB_CONCURRENCY.
     uvicorn.run(app, host="0.0.0.0", port=7002)